@@ -1,11 +1,25 @@
 import json
-import time
 from os import getenv
 import typer
 from dotenv import load_dotenv
-from migration import console
+from migration import console, logger
+from migration.cassette import CassettePlayer, CassetteRecorder
+from migration.exceptions import (
+    CassetteMiss,
+    HCXError,
+    HCXResponseError,
+    RetryBudgetExhausted,
+    StartPipelineError,
+)
 from migration.hcx import HCX
 from migration import utils
+from migration import constants
+from migration.analytics import ReplicationTracker
+from migration.pipeline import StartPipeline
+from migration.profiling import Profiler
+from migration.retry import LatencyTracker
+from contextlib import nullcontext
+from pathlib import Path
 from typing import List
 
 load_dotenv()
@@ -16,9 +30,106 @@ hcx_password = getenv("PASSWORD")
 hcx_url = getenv("HCX_URL")
 
 
-def get_hcx_instance(username, password, url):
-    token = utils.authenticate(url=url, username=username, password=password)
-    return HCX(url=hcx_url, auth_token=token)
+def get_hcx_instance(username, password, url, recorder=None, player=None):
+    if player:
+        # replayed sessions never reach HCX, no token is needed, and their latencies are not real
+        token = None
+        latency_tracker = LatencyTracker()
+    else:
+        token = utils.authenticate(url=url, username=username, password=password)
+        latency_tracker = LatencyTracker(history_file=constants.LATENCY_HISTORY_FILE)
+    return HCX(
+        url=hcx_url, auth_token=token, recorder=recorder, player=player, latency_tracker=latency_tracker
+    )
+
+
+def get_cassettes(record: str, replay: str, replay_speed: float):
+    """
+    Function to create the cassette recorder and player requested on the command line
+    :param record: str: path of the cassette to record, if any
+    :param replay: str: path of the cassette to replay, if any
+    :param replay_speed: float: replay speed factor
+    :return: tuple: recorder and player, None when not requested
+    """
+    if record and replay and Path(record).resolve() == Path(replay).resolve():
+        # the recorder truncates its cassette before the player could read it
+        raise typer.BadParameter("--record and --replay cannot use the same cassette")
+    recorder = CassetteRecorder(record) if record else None
+    player = CassettePlayer(replay, speed=replay_speed) if replay else None
+    if recorder:
+        console.print(f"Recording HCX traffic to {record}", style="bold white")
+    if player:
+        console.print(f"Replaying HCX traffic from {replay}", style="bold white")
+    return recorder, player
+
+
+def is_validation_rejection(error: HCXError) -> bool:
+    """
+    Function to tell a rejected migration config apart from a failed validate request
+    :param error: HCXError: error raised by the validate request
+    :return: bool: True when the error body holds the validation result
+    """
+    return (
+        isinstance(error, HCXResponseError)
+        and error.status_code in constants.VALIDATION_REJECTED_STATUS_CODES
+        and isinstance(error.body, dict)
+        and bool(error.body.get("items"))
+    )
+
+
+def is_permanent_error(error: HCXError) -> bool:
+    """
+    Function to tell errors that retrying a poll cannot fix apart from transient ones
+    :param error: HCXError: error raised by the request
+    :return: bool
+    """
+    if isinstance(error, (RetryBudgetExhausted, CassetteMiss)):
+        return True
+    return (
+        isinstance(error, HCXResponseError)
+        and 400 <= error.status_code < 500
+        and error.status_code not in constants.REJECTED_STATUS_CODES
+    )
+
+
+def get_inventory(hcx):
+    """
+    Function to gather the inventory needed to configure migration items
+    :param hcx: HCX: HCX instance
+    :return: dict: inventory keyed by the configure_migration_item argument names
+    """
+    console.print("Gathering data for endpoints", style="bold green")
+    endpoints = hcx.get_endpoints()
+    console.print("Found configurations for endpoints", style="bold green")
+
+    console.print("Taking inventory of Virtual Machines in the source Datacenter", style="bold green")
+    vms = hcx.get_vms()
+    console.print("Inventory retrieved successfully", style="bold green")
+
+    console.print("Gathering Data stores details in the  Datacenter", style="bold green")
+    data_stores = hcx.get_data_stores()
+    console.print("Found configurations for data stores", style="bold green")
+
+    console.print("Gathering Storage Profiles details in the destination Datacenter", style="bold green")
+    storage_profiles = hcx.get_storage_profiles()
+    console.print("Found configurations for storage profiles", style="bold green")
+
+    console.print("Gathering Network details in the destination Datacenter", style="bold green")
+    networks = hcx.get_networks()
+    console.print("Found configurations for networks", style="bold green")
+
+    console.print("Gathering info for containers", style="bold green")
+    containers = hcx.get_containers()
+    console.print("Found configurations for containers", style="bold green")
+
+    return {
+        "endpoints": endpoints,
+        "vms": vms,
+        "data_stores": data_stores,
+        "storage_profiles": storage_profiles,
+        "networks": networks,
+        "containers": containers,
+    }
 
 
 @app.command(no_args_is_help=True)
@@ -28,37 +139,112 @@ def check_status(
             "--id",
             help="List of migration IDs",
             prompt_required=True
+        ),
+        profile: bool = typer.Option(
+            False, "--profile",
+            help="Profile CPU and memory usage, reports are written to migration_outputs"
+        ),
+        profile_snapshot_interval: int = typer.Option(
+            constants.PROFILE_SNAPSHOT_INTERVAL, "--profile-snapshot-interval",
+            help="Snapshot memory every N exits of a phase when profiling, 1 snapshots every exit"
+        ),
+        record: str = typer.Option(
+            None, "--record",
+            help="Record HCX traffic, with credentials redacted, to a gzip cassette"
+        ),
+        replay: str = typer.Option(
+            None, "--replay",
+            help="Serve HCX responses from a recorded cassette instead of the network"
+        ),
+        replay_speed: float = typer.Option(
+            1.0, "--replay-speed",
+            help="Replay speed factor, 0 replays without delays"
         )
 ):
     """
     Function to check the status of a migration
     :param id: List[str]: list of migration IDs
+    :param profile: bool: run the command under the profiler
+    :param profile_snapshot_interval: int: number of phase exits between memory snapshots
+    :param record: str: cassette to record HCX traffic to
+    :param replay: str: cassette to replay HCX traffic from
+    :param replay_speed: float: replay speed factor
+    :return: None
+    """
+    recorder, player = get_cassettes(record, replay, replay_speed)
+    with Profiler("check_status", enabled=profile, snapshot_interval=profile_snapshot_interval) as profiler:
+        poll_migration_status(migration_ids=id, profiler=profiler, recorder=recorder, player=player)
+
+
+def poll_migration_status(
+        migration_ids: List[str],
+        profiler: Profiler,
+        recorder: CassetteRecorder = None,
+        player: CassettePlayer = None
+):
+    """
+    Function to poll the status of migrations until they complete
+    :param migration_ids: List[str]: list of migration IDs
+    :param profiler: Profiler: profiler measuring each polling round
+    :param recorder: CassetteRecorder: recorder of the HCX traffic (optional)
+    :param player: CassettePlayer: player serving recorded HCX traffic (optional)
     :return: None
     """
     console.print("Establishing connection to HCX", style="bold green")
 
-    hcx = get_hcx_instance(hcx_username, hcx_password, hcx_url)
+    hcx = get_hcx_instance(hcx_username, hcx_password, hcx_url, recorder=recorder, player=player)
 
     console.print("Connection to HCX established", style="bold green")
 
     status = ""
     completed_migrations = []
-    while status != "MIGRATION_COMPLETE":
-        for migration_id in id:
-            if migration_id in completed_migrations:
-                continue
-            progress = hcx.get_migration_status(migration_id)
-            logs = progress[0]["progress"]["log"]
-            status = progress[0]["state"]
-            if status == "MIGRATION_COMPLETE":
-                completed_migrations.append(migration_id)
-            log_messages = [log['message'] for log in logs]
-            console.print(f"[green]MigrationID:[/green] {migration_id}, "
-                          f"[magenta]Status:[/magenta] {status}, "
-                          f"[blue]LogMessages:[/blue] "
-                          f"{log_messages}"
-                          )
-        time.sleep(5)
+    # consecutive failed polls per migration ID, IDs reaching the limit are no longer polled
+    failed_polls = dict.fromkeys(migration_ids, 0)
+    abandoned_migrations = []
+    tracker = ReplicationTracker()
+
+    def is_pending(migration_id):
+        return migration_id not in completed_migrations and migration_id not in abandoned_migrations
+
+    while status != "MIGRATION_COMPLETE" and any(map(is_pending, migration_ids)):
+        with profiler.phase("poll"):
+            for migration_id in migration_ids:
+                if not is_pending(migration_id):
+                    continue
+                try:
+                    progress = hcx.get_migration_status(migration_id)
+                except HCXError as e:
+                    logger.error(e)
+                    console.print(f"Could not get status for {migration_id}: {e}", style="bold red")
+                    if is_permanent_error(e):
+                        raise typer.Exit(code=1)
+                    failed_polls[migration_id] += 1
+                    if failed_polls[migration_id] >= constants.STATUS_MAX_FAILED_POLLS:
+                        console.print(f"Giving up on {migration_id} after "
+                                      f"{failed_polls[migration_id]} failed polls", style="bold red")
+                        abandoned_migrations.append(migration_id)
+                    continue
+                failed_polls[migration_id] = 0
+                tracker.record(migration_id, progress[0])
+                logs = progress[0]["progress"]["log"]
+                status = progress[0]["state"]
+                if status == "MIGRATION_COMPLETE":
+                    completed_migrations.append(migration_id)
+                log_messages = [log['message'] for log in logs]
+                console.print(f"[green]MigrationID:[/green] {migration_id}, "
+                              f"[magenta]Status:[/magenta] {status}, "
+                              f"[blue]LogMessages:[/blue] "
+                              f"{log_messages}"
+                              )
+            if tracker.samples:
+                summary = tracker.summary()
+                for table in tracker.render(summary):
+                    console.print(table)
+                tracker.save(summary)
+        hcx.wait(constants.STATUS_POLL_INTERVAL)
+
+    if abandoned_migrations:
+        raise typer.Exit(code=1)
 
 
 @app.command(no_args_is_help=True)
@@ -67,13 +253,81 @@ def migrate_vm(
             ..., "--filename", "-f",
             help="CSV file containing the migration config",
             prompt_required=True
+        ),
+        profile: bool = typer.Option(
+            False, "--profile",
+            help="Profile CPU and memory usage, reports are written to migration_outputs"
+        ),
+        profile_snapshot_interval: int = typer.Option(
+            constants.PROFILE_SNAPSHOT_INTERVAL, "--profile-snapshot-interval",
+            help="Snapshot memory every N exits of a phase when profiling, 1 snapshots every exit"
+        ),
+        record: str = typer.Option(
+            None, "--record",
+            help="Record HCX traffic, with credentials redacted, to a gzip cassette"
+        ),
+        replay: str = typer.Option(
+            None, "--replay",
+            help="Serve HCX responses from a recorded cassette instead of the network"
+        ),
+        replay_speed: float = typer.Option(
+            1.0, "--replay-speed",
+            help="Replay speed factor, 0 replays without delays"
+        ),
+        pipeline: bool = typer.Option(
+            False, "--pipeline",
+            help="Start validated VMs in small batches while validation continues"
+        ),
+        batch_size: int = typer.Option(
+            constants.PIPELINE_BATCH_SIZE, "--batch-size",
+            help="Number of VMs per start request in pipelined mode"
         )
 ):
     """
     Function to migrate a VM  using HCX Sentinel Agent
     :param filename: str: cvs file containing the migration configuration
+    :param profile: bool: run the command under the profiler
+    :param profile_snapshot_interval: int: number of phase exits between memory snapshots
+    :param record: str: cassette to record HCX traffic to
+    :param replay: str: cassette to replay HCX traffic from
+    :param replay_speed: float: replay speed factor
+    :param pipeline: bool: start validated VMs while validation continues
+    :param batch_size: int: number of VMs per start request in pipelined mode
     ;return: None
     """
+    if profile and pipeline:
+        # start requests run in a background thread that cProfile and the phase snapshots do not cover
+        raise typer.BadParameter("--profile cannot be combined with --pipeline")
+    recorder, player = get_cassettes(record, replay, replay_speed)
+    with Profiler("migrate_vm", enabled=profile, snapshot_interval=profile_snapshot_interval) as profiler:
+        run_migration(
+            filename=filename,
+            profiler=profiler,
+            recorder=recorder,
+            player=player,
+            pipeline=pipeline,
+            batch_size=batch_size
+        )
+
+
+def run_migration(
+        filename: str,
+        profiler: Profiler,
+        recorder: CassetteRecorder = None,
+        player: CassettePlayer = None,
+        pipeline: bool = False,
+        batch_size: int = constants.PIPELINE_BATCH_SIZE
+):
+    """
+    Function to configure, validate and start the migration of the VMs listed in a CSV file
+    :param filename: str: cvs file containing the migration configuration
+    :param profiler: Profiler: profiler measuring each phase of the migration
+    :param recorder: CassetteRecorder: recorder of the HCX traffic (optional)
+    :param player: CassettePlayer: player serving recorded HCX traffic (optional)
+    :param pipeline: bool: start validated VMs in batches while validation continues
+    :param batch_size: int: number of VMs per start request in pipelined mode
+    :return: None
+    """
 
     migration_items = []
     bad_migration_items = []
@@ -85,68 +339,90 @@ def migrate_vm(
 
     console.print("Establishing connection to HCX", style="bold green")
 
-    hcx = get_hcx_instance(hcx_username, hcx_password, hcx_url)
+    hcx = get_hcx_instance(hcx_username, hcx_password, hcx_url, recorder=recorder, player=player)
     console.print("Connection to HCX established", style="bold green")
 
-    console.print("Gathering data for endpoints", style="bold green")
-    endpoints = hcx.get_endpoints()
-    console.print("Found configurations for endpoints", style="bold green")
-
-    console.print("Taking inventory of Virtual Machines in the source Datacenter", style="bold green")
-    vms = hcx.get_vms()
-    console.print("Inventory retrieved successfully", style="bold green")
-
-    console.print("Gathering Data stores details in the  Datacenter", style="bold green")
-    data_stores = hcx.get_data_stores()
-    console.print("Found configurations for data stores", style="bold green")
-
-    console.print("Gathering Storage Profiles details in the destination Datacenter", style="bold green")
-    storage_profiles = hcx.get_storage_profiles()
-    console.print("Found configurations for storage profiles", style="bold green")
-
-    console.print("Gathering Network details in the destination Datacenter", style="bold green")
-    networks = hcx.get_networks()
-    console.print("Found configurations for networks", style="bold green")
-
-    console.print("Gathering info for containers", style="bold green")
-    containers = hcx.get_containers()
-    console.print("Found configurations for containers", style="bold green")
-
-    # iterate over the list of VMs
-    for vm in vm_list:
-
-        console.print(f"Generating migration config for {vm['vmName']}", style="bold green")
-
-        migration_item = utils.configure_migration_item(
-            vm=vm,
-            endpoints=endpoints,
-            vms=vms,
-            storage_profiles=storage_profiles,
-            data_stores=data_stores,
-            containers=containers,
-            networks=networks
-        )
-
-        console.print(f"Done. Config generated successfully for  {vm['vmName']}", style="bold green")
-        console.print(json.dumps(migration_item, indent=4))
-
-        console.print(f"Validating the configuration for  {vm['vmName']}", style="bold green")
-        validation = hcx.migrate(migration_objects=[migration_item], action="validate")
-        console.print(f"Done. Validation completed for {vm['vmName']}", style="bold green")
+    try:
+        with profiler.phase("inventory"):
+            inventory = get_inventory(hcx)
+    except HCXError as e:
+        logger.error(e)
+        console.print(f"Failed to gather inventory from HCX: {e}", style="bold red")
+        raise typer.Exit(code=1)
+
+    start_pipeline = StartPipeline(hcx, batch_size=batch_size) if pipeline else None
+    with start_pipeline or nullcontext():
+        # iterate over the list of VMs
+        for vm in vm_list:
+
+            console.print(f"Generating migration config for {vm['vmName']}", style="bold green")
+
+            try:
+                with profiler.phase("configure"):
+                    migration_item = utils.configure_migration_item(vm=vm, **inventory)
+            except (IndexError, KeyError, TypeError) as e:
+                # a name from the CSV file that is missing from the inventory
+                logger.exception(e)
+                console.print(f"Could not configure {vm['vmName']}, check its names against the inventory: "
+                              f"{e!r}", style="bold red")
+                bad_migration_items.append({"vmName": vm["vmName"], "errors": [repr(e)]})
+                continue
 
-        try:
-            errors = validation["items"][0].get("errors")
-            if errors:
-                console.print(f"Errors found for {vm['vmName']}: {errors}", style="bold red")
-                bad_migration_items.append({"vmName": vm["vmName"], "errors": errors})
-        except TypeError:
-            if validation[0].get("migrationId"):
-                console.print(f"Done. Validation is successful for {vm['vmName']}", style="bold green")
-                migration_items.append(migration_item)
+            console.print(f"Done. Config generated successfully for  {vm['vmName']}", style="bold green")
+            console.print(json.dumps(migration_item, indent=4))
+
+            console.print(f"Validating the configuration for  {vm['vmName']}", style="bold green")
+            with profiler.phase("validate"):
+                try:
+                    validation = hcx.migrate(migration_objects=[migration_item], action="validate")
+                except HCXError as e:
+                    if not is_validation_rejection(e):
+                        logger.error(e)
+                        console.print(f"Validation request failed for {vm['vmName']}: {e}", style="bold red")
+                        bad_migration_items.append({"vmName": vm["vmName"], "errors": [str(e)]})
+                        continue
+                    # HCX rejects invalid configurations with a 4xx status, the errors are in the body
+                    validation = e.body
+            console.print(f"Done. Validation completed for {vm['vmName']}", style="bold green")
+
+            try:
+                errors = validation["items"][0].get("errors")
+                if errors:
+                    console.print(f"Errors found for {vm['vmName']}: {errors}", style="bold red")
+                    bad_migration_items.append({"vmName": vm["vmName"], "errors": errors})
+            except TypeError:
+                if validation[0].get("migrationId"):
+                    console.print(f"Done. Validation is successful for {vm['vmName']}", style="bold green")
+                    if not start_pipeline:
+                        migration_items.append(migration_item)
+                        continue
+                    try:
+                        start_pipeline.submit(vm["vmName"], migration_item)
+                    except StartPipelineError as e:
+                        logger.error(e)
+                        console.print(f"Stopping, {vm['vmName']} not started: {e}", style="bold red")
+                        bad_migration_items.append({"vmName": vm["vmName"], "errors": [str(e)]})
+                        break
+
+    if start_pipeline:
+        console.print(f"Note, migrationIds of this run can be found at migration_outputs/migration_ids.csv",
+                      style="bold white")
+        console.print(f"{len(start_pipeline.started)} migration(s) scheduled, "
+                      f"{len(start_pipeline.failed)} failed to start", style="bold green")
+        for item in start_pipeline.failed:
+            console.print(f"Not started {item['vmName']}: {item['errors']}", style="bold red")
+        if start_pipeline.failed or start_pipeline.error:
+            raise typer.Exit(code=1)
 
     if migration_items:
         console.print(f"Initiating migration task", style="bold green")
-        migration = hcx.migrate(migration_objects=migration_items, action="start")
+        try:
+            with profiler.phase("start"):
+                migration = hcx.migrate(migration_objects=migration_items, action="start")
+        except HCXError as e:
+            logger.error(e)
+            console.print(f"Failed to start migration task: {e}", style="bold red")
+            raise typer.Exit(code=1)
         console.print(f"Note, migrationId of this request can be found at outputs/migration_ids.csv",
                       style="bold white")
         utils.write_csv_file("migration_ids", migration)
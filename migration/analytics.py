@@ -0,0 +1,345 @@
+import time
+from collections import defaultdict, deque, namedtuple
+from datetime import datetime
+from math import sqrt
+from statistics import mean, stdev
+
+from rich.table import Table
+
+from . import constants
+from .utils import append_csv_file
+
+ProgressSample = namedtuple(
+    "ProgressSample", ["timestamp", "state", "percent", "transferred_bytes", "total_bytes"]
+)
+
+MIGRATION_TIMESERIES_HEADERS = [
+    "timestamp",
+    "migrationId",
+    "vmName",
+    "datastore",
+    "destinationEndpoint",
+    "state",
+    "percent",
+    "transferredBytes",
+    "totalBytes",
+    "rate",
+    "unit",
+    "byteRate",
+    "percentRate",
+    "eta",
+    "etaLow",
+    "etaHigh",
+]
+WAVE_TIMESERIES_HEADERS = [
+    "timestamp",
+    "activeMigrations",
+    "aggregateRate",
+    "aggregatePercentRate",
+    "eta",
+    "etaLow",
+    "etaHigh",
+]
+
+
+def _to_number(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return None
+
+
+def _find_number(data, keys):
+    """
+    Depth-first search for the first numeric value stored under one of the keys
+    :param data: dict or list to search
+    :param keys: tuple: candidate keys, in order of preference
+    :return: the value found or None
+    """
+    if isinstance(data, dict):
+        for key in keys:
+            value = _to_number(data.get(key))
+            if value is not None:
+                return value
+        children = data.values()
+    elif isinstance(data, list):
+        children = data
+    else:
+        return None
+    for child in children:
+        value = _find_number(child, keys)
+        if value is not None:
+            return value
+    return None
+
+
+def _get_nested(data: dict, *keys):
+    for key in keys:
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
+
+def extract_progress(item: dict, timestamp: float) -> ProgressSample:
+    """
+    Extract the progress figures from a migration status item
+    :param item: dict: migration item returned by get_migration_status
+    :param timestamp: float: time the status was received
+    :return: ProgressSample
+    """
+    # the rest of the item echoes the migration config, whose numbers have nothing to do with progress
+    progress = item.get("progress") or {}
+    percent = _find_number(progress, constants.PERCENT_COMPLETE_KEYS)
+    transferred_bytes = _find_number(progress, constants.TRANSFERRED_BYTES_KEYS)
+    total_bytes = _find_number(progress, constants.TOTAL_BYTES_KEYS)
+    if percent is None and transferred_bytes is not None and total_bytes:
+        percent = transferred_bytes / total_bytes * 100
+    return ProgressSample(timestamp, item.get("state"), percent, transferred_bytes, total_bytes)
+
+
+def extract_labels(item: dict, migration_id: str) -> dict:
+    """
+    Extract the dimensions throughput is grouped by from a migration status item
+    :param item: dict: migration item returned by get_migration_status
+    :param migration_id: str: migration ID, used when the VM name is missing
+    :return: dict: vmName, datastore and destinationEndpoint
+    """
+    return {
+        "vmName": _get_nested(item, "entity", "entityName") or migration_id,
+        "datastore": _get_nested(item, "storage", "defaultStorage", "name") or "unknown",
+        "destinationEndpoint": _get_nested(item, "destination", "endpointName") or "unknown",
+    }
+
+
+def format_rate(rate, unit: str) -> str:
+    if rate is None:
+        return "-"
+    if unit == "percent":
+        return f"{rate * 60:.2f} %/min"
+    for suffix in ("B/s", "KB/s", "MB/s", "GB/s"):
+        if abs(rate) < 1024:
+            return f"{rate:.1f} {suffix}"
+        rate /= 1024
+    return f"{rate:.1f} TB/s"
+
+
+def format_duration(seconds) -> str:
+    if seconds is None:
+        return "-"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m {seconds:02d}s"
+
+
+def _sum_byte_rates(estimates: list):
+    rates = [e["byteRate"] for e in estimates if e["byteRate"] is not None]
+    return sum(rates) if rates else None
+
+
+def _mean_percent_rate(estimates: list):
+    rated = [e for e in estimates if e["percentRate"] is not None]
+    if not rated:
+        return None
+    if all(e["totalBytes"] for e in rated):
+        return sum(e["percentRate"] * e["totalBytes"] for e in rated) / sum(e["totalBytes"] for e in rated)
+    return mean(e["percentRate"] for e in rated)
+
+
+class ReplicationTracker:
+    """
+    Class to derive throughput and ETA figures from successive migration status polls
+    """
+    def __init__(self, window: int = constants.THROUGHPUT_WINDOW, z: float = constants.ETA_CONFIDENCE_Z):
+        self.z = z
+        self.samples = defaultdict(lambda: deque(maxlen=window))
+        self.labels = {}
+
+    def record(self, migration_id: str, item: dict, timestamp: float = None) -> ProgressSample:
+        """
+        Record a migration status
+        :param migration_id: str: migration ID
+        :param item: dict: migration item returned by get_migration_status
+        :param timestamp: float: time the status was received, defaults to now
+        :return: ProgressSample
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        sample = extract_progress(item, timestamp)
+        self.samples[migration_id].append(sample)
+        self.labels[migration_id] = extract_labels(item, migration_id)
+        return sample
+
+    def estimate(self, migration_id: str) -> dict:
+        """
+        Estimate throughput and ETA of a single migration
+        Rates are in bytes per second when HCX reports transferred bytes, in percent per second otherwise.
+        :param migration_id: str: migration ID
+        :return: dict: latest progress, rate and ETA with its confidence bounds
+        """
+        samples = list(self.samples[migration_id])
+        latest = samples[-1]
+        unit = "bytes" if all(s.transferred_bytes is not None for s in samples) else "percent"
+        field = "transferred_bytes" if unit == "bytes" else "percent"
+
+        rates = []
+        for previous, current in zip(samples, samples[1:]):
+            elapsed = current.timestamp - previous.timestamp
+            before, after = getattr(previous, field), getattr(current, field)
+            if elapsed > 0 and before is not None and after is not None:
+                # progress going backwards is a restarted transfer or a counter reset, not negative throughput
+                rates.append(max(after - before, 0) / elapsed)
+
+        estimate = self.labels[migration_id] | {
+            "migrationId": migration_id,
+            "state": latest.state,
+            "percent": latest.percent,
+            "transferredBytes": latest.transferred_bytes,
+            "totalBytes": latest.total_bytes,
+            "rate": None,
+            "unit": unit,
+            "byteRate": None,
+            "percentRate": None,
+            "eta": None,
+            "etaLow": None,
+            "etaHigh": None,
+        }
+        if latest.state == "MIGRATION_COMPLETE":
+            return estimate | {"rate": 0, "byteRate": 0, "percentRate": 0, "eta": 0, "etaLow": 0, "etaHigh": 0}
+        if not rates:
+            return estimate
+
+        rate = mean(rates)
+        # with a single interval there is nothing to derive a spread from, keep the bounds open
+        margin = self.z * stdev(rates) / sqrt(len(rates)) if len(rates) > 1 else rate
+        rate_low, rate_high = max(rate - margin, 0), rate + margin
+        remaining = self._remaining(latest, unit)
+        estimate["rate"] = rate
+        # express the rate in both units whenever the total size is known, so every migration can be aggregated
+        if unit == "bytes":
+            estimate["byteRate"] = rate
+            estimate["percentRate"] = rate / latest.total_bytes * 100 if latest.total_bytes else None
+        else:
+            estimate["percentRate"] = rate
+            estimate["byteRate"] = rate / 100 * latest.total_bytes if latest.total_bytes else None
+        if remaining is not None:
+            estimate["eta"] = remaining / rate if rate > 0 else None
+            estimate["etaLow"] = remaining / rate_high if rate_high > 0 else None
+            estimate["etaHigh"] = remaining / rate_low if rate_low > 0 else None
+        return estimate
+
+    @staticmethod
+    def _remaining(sample: ProgressSample, unit: str):
+        if unit == "percent":
+            return None if sample.percent is None else max(100 - sample.percent, 0)
+        if sample.total_bytes:
+            return max(sample.total_bytes - sample.transferred_bytes, 0)
+        if sample.percent:
+            return sample.transferred_bytes * (100 - sample.percent) / sample.percent
+        return None
+
+    def summary(self) -> dict:
+        """
+        Aggregate the estimates of every tracked migration
+        Byte rates are summed, percent rates are averaged, weighted by totalBytes when every migration reports it.
+        Migrations replicate in parallel, so the wave ETA is the latest ETA of the active migrations.
+        :return: dict: per migration estimates, rates grouped by VM, datastore and destination endpoint,
+            aggregate rates and wave ETA with its confidence bounds
+        """
+        estimates = [self.estimate(migration_id) for migration_id in self.samples]
+        active = [e for e in estimates if e["state"] != "MIGRATION_COMPLETE"]
+
+        groups = {}
+        for dimension in ("vmName", "datastore", "destinationEndpoint"):
+            members = defaultdict(list)
+            for e in active:
+                members[e[dimension]].append(e)
+            groups[dimension] = {
+                name: {"byteRate": _sum_byte_rates(group), "percentRate": _mean_percent_rate(group)}
+                for name, group in members.items()
+            }
+
+        def latest(key):
+            values = [e[key] for e in active]
+            if not values or any(value is None for value in values):
+                return None
+            return max(values)
+
+        return {
+            "estimates": estimates,
+            "groups": groups,
+            "activeMigrations": len(active),
+            "aggregateRate": _sum_byte_rates(active),
+            "aggregatePercentRate": _mean_percent_rate(active),
+            "eta": latest("eta") if active else 0,
+            "etaLow": latest("etaLow") if active else 0,
+            "etaHigh": latest("etaHigh") if active else 0,
+        }
+
+    def render(self, summary: dict) -> list:
+        """
+        Build the live tables printed after each poll
+        :param summary: dict: result of summary()
+        :return: list of rich tables
+        """
+        migrations = Table(title="Replication progress")
+        for column in ("VM", "Datastore", "Destination", "State", "Progress", "Rate", "ETA (95% bounds)"):
+            migrations.add_column(column)
+        for e in summary["estimates"]:
+            migrations.add_row(
+                e["vmName"],
+                e["datastore"],
+                e["destinationEndpoint"],
+                str(e["state"]),
+                "-" if e["percent"] is None else f"{e['percent']:.1f}%",
+                format_rate(e["rate"], e["unit"]),
+                f"{format_duration(e['eta'])} ({format_duration(e['etaLow'])} - {format_duration(e['etaHigh'])})",
+            )
+
+        throughput = Table(title="Throughput")
+        for column in ("Dimension", "Name", "Rate", "Progress rate"):
+            throughput.add_column(column)
+        for dimension, totals in summary["groups"].items():
+            for name, rates in totals.items():
+                throughput.add_row(
+                    dimension,
+                    name,
+                    format_rate(rates["byteRate"], "bytes"),
+                    format_rate(rates["percentRate"], "percent"),
+                )
+        throughput.add_row(
+            "wave",
+            f"{summary['activeMigrations']} active",
+            format_rate(summary["aggregateRate"], "bytes"),
+            format_rate(summary["aggregatePercentRate"], "percent"),
+        )
+        throughput.caption = (
+            f"Wave ETA: {format_duration(summary['eta'])} "
+            f"({format_duration(summary['etaLow'])} - {format_duration(summary['etaHigh'])})"
+        )
+        return [migrations, throughput]
+
+    def save(self, summary: dict, timestamp: float = None):
+        """
+        Append the summary to the time series stored in migration_outputs
+        :param summary: dict: result of summary()
+        :param timestamp: float: time of the poll, defaults to now
+        :return: None
+        """
+        when = datetime.fromtimestamp(time.time() if timestamp is None else timestamp).isoformat()
+        append_csv_file(
+            "replication_timeseries",
+            MIGRATION_TIMESERIES_HEADERS,
+            [{"timestamp": when} | e for e in summary["estimates"]],
+        )
+        append_csv_file(
+            "replication_wave_timeseries",
+            WAVE_TIMESERIES_HEADERS,
+            [{"timestamp": when} | {key: summary[key] for key in WAVE_TIMESERIES_HEADERS[1:]}],
+        )
@@ -0,0 +1,185 @@
+import gzip
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from . import constants
+from . import logger
+from .exceptions import CassetteMiss
+
+
+def redact(data):
+    """
+    Replace the values of credential keys in a nested structure
+    :param data: dict, list or scalar
+    :return: copy of data with the credentials redacted
+    """
+    if isinstance(data, dict):
+        return {
+            key: constants.REDACTED_VALUE if key.lower() in constants.REDACTED_KEYS else redact(value)
+            for key, value in data.items()
+        }
+    if isinstance(data, list):
+        return [redact(value) for value in data]
+    return data
+
+
+def _redact_body(body):
+    if not body:
+        return body
+    try:
+        return json.dumps(redact(json.loads(body)))
+    except ValueError:
+        return body
+
+
+def _request_key(method: str, url: str, body):
+    """
+    Key used to match a replayed request with a recorded one
+    The host is left out so a cassette can be replayed against any HCX_URL, and the body is redacted the same
+    way it was when recorded.
+    """
+    parts = urlsplit(url)
+    path = f"{parts.path}?{parts.query}" if parts.query else parts.path
+    if body:
+        try:
+            body = json.dumps(redact(json.loads(body)), sort_keys=True)
+        except ValueError:
+            pass
+    return method.upper(), path, body or None
+
+
+class CassetteRecorder:
+    """
+    Class writing every exchange with HCX to a gzip compressed JSON lines cassette
+    """
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # start from an empty cassette
+        with gzip.open(self.path, "wt", encoding="utf-8"):
+            pass
+
+    def record(self, method: str, url: str, body, elapsed: float, response=None, error: Exception = None):
+        """
+        Append an exchange to the cassette
+        :param method: str: HTTP method
+        :param url: str: request url
+        :param body: request body
+        :param elapsed: float: seconds until the response or the error was received
+        :param response: requests.Response: response received, if any
+        :param error: Exception: transport error raised, if any
+        :return: None
+        """
+        entry = {
+            "elapsed": elapsed,
+            "method": method.upper(),
+            "url": url,
+            "body": _redact_body(body),
+        }
+        if response is not None:
+            entry["response"] = {
+                "status_code": response.status_code,
+                "headers": redact(dict(response.headers)),
+                "body": _redact_body(response.text),
+            }
+        else:
+            entry["error"] = {"type": type(error).__name__, "message": str(error)}
+        with self._lock:
+            # each exchange is a separate gzip member so an interrupted run keeps its cassette
+            with gzip.open(self.path, "at", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+
+
+class CassettePlayer:
+    """
+    Class serving the exchanges of a cassette instead of sending requests to HCX
+    Requests are matched on method, path and body, then on method and path. Recorded responses are served
+    in order; once a sequence is exhausted its last response keeps being served, so status polling settles
+    on the final recorded state.
+    """
+    def __init__(self, path: str, speed: float = 1.0):
+        """
+        :param path: str: cassette written by CassetteRecorder
+        :param speed: float: replay speed factor, 0 serves responses without any delay
+        """
+        self.speed = speed
+        self._lock = threading.Lock()
+        self._exact = defaultdict(deque)
+        self._by_path = defaultdict(deque)
+        self._last = {}
+        self._served = set()
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for position, line in enumerate(f):
+                entry = json.loads(line)
+                key = _request_key(entry["method"], entry["url"], entry["body"])
+                self._exact[key].append((position, entry))
+                self._by_path[key[:2]].append((position, entry))
+
+    def _next_entry(self, key):
+        with self._lock:
+            entry = self._pop(self._exact.get(key))
+            if entry is None and key in self._last:
+                return self._last[key]
+            if entry is None:
+                # the body differs from every recording, e.g. a regenerated payload
+                entry = self._pop(self._by_path.get(key[:2]))
+            if entry is None:
+                return self._last.get(key[:2])
+            self._last[key] = self._last[key[:2]] = entry
+            return entry
+
+    def _pop(self, entries):
+        while entries:
+            position, entry = entries.popleft()
+            if position not in self._served:
+                self._served.add(position)
+                return entry
+        return None
+
+    def wait(self, seconds: float):
+        """
+        Sleep for a recorded duration, scaled by the replay speed
+        :param seconds: float: duration in the recorded run
+        :return: None
+        """
+        if self.speed:
+            time.sleep(seconds / self.speed)
+
+    def play(self, method: str, url: str, body):
+        """
+        Serve the recorded response of a request
+        :param method: str: HTTP method
+        :param url: str: request url
+        :param body: request body
+        :return: requests.Response
+        :raises requests.exceptions.RequestException: when the recorded exchange failed
+        :raises CassetteMiss: when nothing in the cassette matches the request
+        """
+        key = _request_key(method, url, body)
+        entry = self._next_entry(key)
+        if entry is None:
+            error = CassetteMiss(method, url)
+            logger.error(error)
+            raise error
+
+        self.wait(entry["elapsed"])
+
+        if "error" in entry:
+            error_type = getattr(requests.exceptions, entry["error"]["type"], requests.exceptions.RequestException)
+            raise error_type(entry["error"]["message"])
+
+        response = requests.Response()
+        response.status_code = entry["response"]["status_code"]
+        response.headers = CaseInsensitiveDict(entry["response"]["headers"])
+        response._content = (entry["response"]["body"] or "").encode("utf-8")
+        response.encoding = "utf-8"
+        response.url = url
+        return response
@@ -54,3 +54,61 @@ VM_FILTER = {
 
 LOCAL_FILTER = {"filter": {"cloud": {"local": True}}}
 REMOTE_FILTER = {"filter": {"cloud": {"remote": True}}}
+
+# request layer settings
+# (connect timeout, read timeout) in seconds
+REQUEST_TIMEOUT = (10, 300)
+RETRY_MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+# total number of retries allowed across a whole run
+RETRY_BUDGET = 50
+RETRYABLE_STATUS_CODES = {429, 502, 503, 504}
+# status codes that guarantee the server did not act on the request
+REJECTED_STATUS_CODES = {429}
+# status codes HCX answers a validate request with when it rejects the migration config
+VALIDATION_REJECTED_STATUS_CODES = {400, 422}
+# hedged requests are duplicated once they exceed the p95 latency of their endpoint. An endpoint is only
+# read a few times per run, so latencies are kept across runs in LATENCY_HISTORY_FILE and the default
+# delay applies until an endpoint has HEDGE_MIN_SAMPLES samples.
+HEDGE_DEFAULT_DELAY = 10.0
+HEDGE_PERCENTILE = 95
+HEDGE_MIN_SAMPLES = 20
+HEDGE_WINDOW_SIZE = 200
+LATENCY_HISTORY_FILE = "migration_outputs/latency_history.json"
+
+# seconds between two rounds of migration status polling
+STATUS_POLL_INTERVAL = 5
+# consecutive failed polls after which a migration ID is no longer polled
+STATUS_MAX_FAILED_POLLS = 10
+
+# replication analytics settings
+# keys HCX uses for progress figures, searched in order within the migration progress
+PERCENT_COMPLETE_KEYS = ("percentComplete", "progressPercentage", "percentage", "percent")
+TRANSFERRED_BYTES_KEYS = ("transferredBytes", "bytesTransferred", "replicatedBytes")
+TOTAL_BYTES_KEYS = ("totalBytes", "bytesTotal", "diskSizeBytes")
+# number of status samples per migration used to estimate throughput
+THROUGHPUT_WINDOW = 12
+# z-score used for the ETA confidence bounds (95%)
+ETA_CONFIDENCE_Z = 1.96
+
+# profiling settings
+PROFILE_TOP_N = 25
+# number of frames kept by tracemalloc for each allocation
+PROFILE_TRACEBACK_LIMIT = 10
+# phases entered repeatedly are snapshotted on their first exit and then every N exits, 1 snapshots every exit
+PROFILE_SNAPSHOT_INTERVAL = 10
+
+# record/replay settings
+# header and body keys whose values are never written to a cassette, compared case-insensitively
+REDACTED_KEYS = {"password", "x-hm-authorization", "authorization", "cookie", "set-cookie", "token"}
+REDACTED_VALUE = "REDACTED"
+
+MIGRATION_ID_HEADERS = ["migrationId", "migrationGroupId", "entityId"]
+
+# pipelined start settings
+PIPELINE_BATCH_SIZE = 5
+# validated items waiting to be started, validation blocks when the queue is full
+PIPELINE_QUEUE_SIZE = 20
+# seconds to wait for more validated items before starting a partial batch
+PIPELINE_FLUSH_INTERVAL = 30
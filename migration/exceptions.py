@@ -0,0 +1,63 @@
+class HCXError(Exception):
+    """
+    Base class for errors raised while talking to HCX
+    """
+
+
+class HCXConnectionError(HCXError):
+    """
+    Raised when HCX could not be reached after all retries were exhausted
+    """
+
+    def __init__(self, method: str, url: str, attempts: int, cause: Exception):
+        self.method = method
+        self.url = url
+        self.attempts = attempts
+        self.cause = cause
+        super().__init__(f"{method} {url} failed after {attempts} attempt(s): {cause}")
+
+
+class HCXResponseError(HCXError):
+    """
+    Raised when HCX answers with a non-2xx status code
+    """
+
+    def __init__(self, method: str, url: str, status_code: int, body):
+        self.method = method
+        self.url = url
+        self.status_code = status_code
+        self.body = body
+        super().__init__(f"{method} {url} returned HTTP {status_code}: {body}")
+
+
+class RetryBudgetExhausted(HCXError):
+    """
+    Raised when the per-run retry budget has been used up
+    """
+
+    def __init__(self, method: str, url: str, cause: Exception):
+        self.method = method
+        self.url = url
+        self.cause = cause
+        super().__init__(f"{method} {url} not retried, retry budget exhausted: {cause}")
+
+
+class CassetteMiss(HCXError):
+    """
+    Raised when a replayed request has no matching exchange in the cassette
+    """
+
+    def __init__(self, method: str, url: str):
+        self.method = method
+        self.url = url
+        super().__init__(f"No recorded exchange for {method} {url}")
+
+
+class StartPipelineError(HCXError):
+    """
+    Raised when the start pipeline has stopped and no longer accepts migration items
+    """
+
+    def __init__(self, cause: Exception = None):
+        self.cause = cause
+        super().__init__(f"Start pipeline stopped: {cause}")
@@ -5,7 +5,7 @@ from .constants import ALL_FILTERS, EMPTY_FILTER, VM_FILTER
 
 
 class HCX:
-    def __init__(self, url, auth_token):
+    def __init__(self, url, auth_token, recorder=None, player=None, latency_tracker=None):
         self.url = f"https://{url}"
         self.api_url = f"{self.url}/hybridity/api"
         self.headers = {
@@ -13,18 +13,30 @@ class HCX:
             "Content-Type": "application/json",
             "x-hm-authorization": auth_token,
         }
-        self.make_api_request = MakeApiRequest(self.api_url, self.headers)
+        self.make_api_request = MakeApiRequest(
+            self.api_url,
+            self.headers,
+            latency_tracker=latency_tracker,
+            recorder=recorder,
+            player=player,
+        )
 
-    def make_request(self, method, endpoint, payload=None):
+    def make_request(self, method, endpoint, payload=None, idempotent=False, hedge=False):
         response = self.make_api_request(
             method=method,
             endpoint=endpoint,
+            idempotent=idempotent,
+            hedge=hedge,
             data=json.dumps(payload) if payload else None,
         )
         return response
 
+    def wait(self, seconds):
+        self.make_api_request.wait(seconds)
+
     def _get_data(self, endpoint, filter=ALL_FILTERS):
-        return self.make_request("POST", endpoint, filter)
+        # inventory queries are POSTs but have no side effects
+        return self.make_request("POST", endpoint, filter, idempotent=True, hedge=True)
 
     def get_networks(self):
         return self._get_data("service/inventory/networks")
@@ -50,7 +62,8 @@ class HCX:
     def migrate(self, migration_objects, action):
         endpoint = f"mobility/migrations/{action}"
         payload = {"items": migration_objects}
-        return self.make_request("POST", endpoint, payload)
+        # "start" creates migrations on HCX and must never be replayed blindly
+        return self.make_request("POST", endpoint, payload, idempotent=action == "validate")
 
     def get_migration_status(self, migration_id):
         endpoint = "migrations/?action=query"
@@ -58,4 +71,4 @@ class HCX:
             "filter": {"migrationId": [migration_id]},
             "options": {"compat": 2.1},
         }
-        return self.make_request("POST", endpoint, payload)
+        return self.make_request("POST", endpoint, payload, idempotent=True)
@@ -0,0 +1,173 @@
+import json
+import queue
+import threading
+
+from . import constants
+from . import logger, console
+from .exceptions import HCXError, StartPipelineError
+from .utils import append_csv_file, write_csv_file
+
+_DONE = object()
+
+
+class StartPipeline:
+    """
+    Class starting validated migration items in small batches from a background thread
+    Validation keeps running while earlier items replicate, and every migrationId is written to
+    migration_outputs/migration_ids.csv as soon as HCX returns it. Queued items are still started when the
+    pipeline exits on an error; only an interrupt (Ctrl-C, SystemExit) discards them and reports them as failed.
+    """
+    def __init__(
+        self,
+        hcx,
+        batch_size: int = constants.PIPELINE_BATCH_SIZE,
+        queue_size: int = constants.PIPELINE_QUEUE_SIZE,
+        flush_interval: float = constants.PIPELINE_FLUSH_INTERVAL,
+    ):
+        self.hcx = hcx
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.started = []
+        self.failed = []
+        self.error = None
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._aborted = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="start-pipeline", daemon=True)
+
+    def __enter__(self):
+        # truncate the migration IDs of a previous run
+        write_csv_file("migration_ids", [])
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None and issubclass(exc_type, (KeyboardInterrupt, SystemExit)):
+            self.abort()
+        else:
+            # items validated before a crash are still started
+            self.close()
+        return False
+
+    def submit(self, vm_name: str, migration_item: dict):
+        """
+        Queue a validated migration item, blocking while the queue is full
+        :param vm_name: str: name of the VM
+        :param migration_item: dict: validated migration item
+        :return: None
+        :raises StartPipelineError: when the pipeline has stopped
+        """
+        self._put((vm_name, migration_item))
+
+    def close(self):
+        """
+        Start the remaining queued items and wait for the submission thread to finish
+        :return: None
+        """
+        if self._thread.is_alive():
+            try:
+                self._put(_DONE)
+            except StartPipelineError:
+                pass
+            self._thread.join()
+        # items left behind by a submission thread that stopped on an error
+        self._discard(self._drain(), f"not started, start pipeline failed: {self.error}")
+
+    def abort(self):
+        """
+        Discard the queued items and wait for the batch being started, if any, to finish
+        :return: None
+        """
+        self._aborted.set()
+        self._discard(self._drain(), "not started, run interrupted")
+        if self._thread.is_alive():
+            try:
+                self._queue.put_nowait(_DONE)
+            except queue.Full:
+                pass
+            self._thread.join()
+        self._discard(self._drain(), "not started, run interrupted")
+        if self.failed:
+            console.print(
+                f"Migration not started for {', '.join(item['vmName'] for item in self.failed)}",
+                style="bold red",
+            )
+
+    def _put(self, entry):
+        while True:
+            if self.error is not None or not self._thread.is_alive():
+                raise StartPipelineError(self.error)
+            try:
+                self._queue.put(entry, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def _drain(self) -> list:
+        entries = []
+        while True:
+            try:
+                entry = self._queue.get_nowait()
+            except queue.Empty:
+                return entries
+            if entry is not _DONE:
+                entries.append(entry)
+
+    def _discard(self, batch: list, reason: str):
+        self.failed.extend({"vmName": vm_name, "errors": [reason]} for vm_name, _ in batch)
+
+    def _run(self):
+        batch = []
+        while True:
+            try:
+                entry = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                entry = None
+            if self._aborted.is_set():
+                if entry is not None and entry is not _DONE:
+                    batch.append(entry)
+                self._discard(batch, "not started, run interrupted")
+                return
+            if entry is _DONE:
+                self._flush(batch)
+                return
+            if entry is not None:
+                batch.append(entry)
+                if len(batch) < self.batch_size:
+                    continue
+            # the batch is full, or validation is slow and the items already validated should not wait
+            if batch and not self._flush(batch):
+                return
+            batch = []
+
+    def _flush(self, batch: list) -> bool:
+        if not batch:
+            return True
+        try:
+            self._start_batch(batch)
+        except Exception as e:
+            logger.exception(e)
+            console.print(f"Start pipeline stopped: {e}", style="bold red")
+            self.error = e
+            self._discard(batch, f"start pipeline failed: {e}")
+            self._discard(self._drain(), f"not started, start pipeline failed: {e}")
+            return False
+        return True
+
+    def _start_batch(self, batch: list):
+        vm_names = [vm_name for vm_name, _ in batch]
+        console.print(f"Initiating migration task for {', '.join(vm_names)}", style="bold green")
+        try:
+            migration = self.hcx.migrate(
+                migration_objects=[migration_item for _, migration_item in batch], action="start"
+            )
+        except HCXError as e:
+            logger.error(e)
+            console.print(f"Failed to start migration task for {', '.join(vm_names)}: {e}", style="bold red")
+            self._discard(batch, str(e))
+            return
+        # keep the raw response in the log in case it cannot be written to migration_ids.csv
+        logger.info(f"Migration task started for {', '.join(vm_names)}: {json.dumps(migration)}")
+        append_csv_file("migration_ids", constants.MIGRATION_ID_HEADERS, migration)
+        self.started.extend(migration)
+        console.print(json.dumps(migration, indent=4))
+        console.print(f"Migration task scheduled successfully for {', '.join(vm_names)}", style="bold green")
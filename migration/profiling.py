@@ -0,0 +1,174 @@
+import cProfile
+import io
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from . import constants
+from . import console
+
+SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+]
+
+
+class PhaseStats:
+    """
+    Class holding the measurements of a phase, accumulated over every time it was entered
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.elapsed = 0.0
+        self.peak = 0
+        self.first_snapshot = None
+        self.last_snapshot = None
+        self.last_snapshot_call = None
+
+
+class Profiler:
+    """
+    Context manager running a command under cProfile and tracemalloc
+    When disabled every method is a no-op, so commands can use it unconditionally.
+    Note that cProfile only samples the thread it was started in.
+    """
+    def __init__(
+            self,
+            name: str,
+            enabled: bool = False,
+            top_n: int = constants.PROFILE_TOP_N,
+            snapshot_interval: int = constants.PROFILE_SNAPSHOT_INTERVAL
+    ):
+        self.name = name
+        self.enabled = enabled
+        self.top_n = top_n
+        self.snapshot_interval = max(snapshot_interval, 1)
+        self.phases = {}
+        self.peak = 0
+        self._profile = None
+        self._baseline = None
+        self._final = None
+
+    def __enter__(self):
+        if self.enabled:
+            tracemalloc.start(constants.PROFILE_TRACEBACK_LIMIT)
+            self._baseline = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.enabled:
+            self._profile.disable()
+            self._update_peak()
+            self._final = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+            self.write_reports()
+            tracemalloc.stop()
+        return False
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        Measure a phase of the command and snapshot the allocations at its end
+        Snapshots are expensive, phases entered once per VM are snapshotted on their first exit
+        and then every snapshot_interval exits.
+        :param name: str: name of the phase
+        :return: None
+        """
+        if not self.enabled:
+            yield
+            return
+        stats = self.phases.setdefault(name, PhaseStats(name))
+        # phases reset the tracemalloc peak, keep the run-wide peak up to date first
+        self._update_peak()
+        tracemalloc.reset_peak()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            stats.calls += 1
+            stats.elapsed += time.perf_counter() - started
+            stats.peak = max(stats.peak, tracemalloc.get_traced_memory()[1])
+            if stats.first_snapshot is None:
+                stats.first_snapshot = self._take_snapshot()
+            elif stats.calls % self.snapshot_interval == 0:
+                stats.last_snapshot = self._take_snapshot()
+                stats.last_snapshot_call = stats.calls
+
+    def _update_peak(self):
+        self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+
+    def _take_snapshot(self):
+        # keep the snapshot itself out of the CPU profile
+        self._profile.disable()
+        try:
+            return tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+        finally:
+            self._profile.enable()
+
+    def write_reports(self):
+        """
+        Write the cProfile stats and the top-N allocation report to migration_outputs
+        :return: None
+        """
+        output_dir = Path("migration_outputs")
+        output_dir.mkdir(exist_ok=True)
+        prefix = f"{self.name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        profile_path = output_dir / f"{prefix}.prof"
+        report_path = output_dir / f"{prefix}_allocations.txt"
+
+        self._profile.dump_stats(profile_path)
+        with open(report_path, "w", encoding="utf-8") as f:
+            f.write(self.allocation_report())
+
+        console.print(f"Profile written to {profile_path}", style="bold white")
+        console.print(f"Allocation report written to {report_path}", style="bold white")
+
+    def allocation_report(self) -> str:
+        """
+        Build the allocation report
+        For each phase the report lists the top-N allocation sites at its first exit compared to the previous phase
+        and, for phases entered repeatedly, the growth between the first and the last snapshotted exit,
+        followed by the allocation sites at the end of the command.
+        :return: str
+        """
+        current = tracemalloc.get_traced_memory()[0]
+        lines = [
+            f"Profile of {self.name}",
+            f"Traced memory at exit: {current / 1024:.1f} KiB, peak over the run: {self.peak / 1024:.1f} KiB",
+            "",
+        ]
+        previous = self._baseline
+        for stats in self.phases.values():
+            lines.append(
+                f"== Phase {stats.name}: {stats.calls} call(s), {stats.elapsed:.3f}s, "
+                f"peak {stats.peak / 1024:.1f} KiB"
+            )
+            lines.append(f"Top {self.top_n} allocation sites compared to the previous phase:")
+            for diff in stats.first_snapshot.compare_to(previous, "lineno")[:self.top_n]:
+                lines.append(f"  {diff}")
+            lines.append("")
+            if stats.last_snapshot is not None:
+                lines.append(
+                    f"Top {self.top_n} allocation sites grown between call 1 and call {stats.last_snapshot_call}:"
+                )
+                for diff in stats.last_snapshot.compare_to(stats.first_snapshot, "lineno")[:self.top_n]:
+                    lines.append(f"  {diff}")
+                lines.append("")
+            previous = stats.first_snapshot
+
+        lines.append(f"== End of {self.name}: top {self.top_n} allocation sites compared to the previous phase:")
+        for diff in self._final.compare_to(previous, "lineno")[:self.top_n]:
+            lines.append(f"  {diff}")
+        lines.append("")
+
+        stream = io.StringIO()
+        pstats.Stats(self._profile, stream=stream).sort_stats("cumulative").print_stats(self.top_n)
+        lines.append(f"== Top {self.top_n} functions by cumulative time")
+        lines.append(stream.getvalue())
+        return "\n".join(lines)
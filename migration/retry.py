@@ -0,0 +1,147 @@
+import json
+import random
+import threading
+from collections import defaultdict, deque
+from pathlib import Path
+from statistics import quantiles
+
+import requests
+
+from . import constants
+from . import logger
+
+
+class RetryPolicy:
+    """
+    Class deciding whether a failed request may be retried and how long to wait before doing so
+    """
+    def __init__(
+        self,
+        max_attempts: int = constants.RETRY_MAX_ATTEMPTS,
+        base_delay: float = constants.RETRY_BASE_DELAY,
+        max_delay: float = constants.RETRY_MAX_DELAY,
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Exponential backoff with full jitter
+        :param attempt: int: number of the attempt that just failed, starting at 1
+        :return: float: seconds to wait before the next attempt
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def should_retry_exception(self, error: Exception, idempotent: bool, attempt: int) -> bool:
+        """
+        Decide whether a request that raised an exception may be sent again
+        :param error: Exception: exception raised by the transport
+        :param idempotent: bool: whether replaying the request is safe
+        :param attempt: int: number of the attempt that just failed, starting at 1
+        :return: bool
+        """
+        if attempt >= self.max_attempts:
+            return False
+        if idempotent:
+            return isinstance(
+                error,
+                (
+                    requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout,
+                    requests.exceptions.ChunkedEncodingError,
+                ),
+            )
+        # the request may have reached HCX, only replay it when the connection was never established
+        return isinstance(error, requests.exceptions.ConnectTimeout)
+
+    def should_retry_status(self, status_code: int, idempotent: bool, attempt: int) -> bool:
+        """
+        Decide whether a request that returned a non-2xx status code may be sent again
+        :param status_code: int: HTTP status code
+        :param idempotent: bool: whether replaying the request is safe
+        :param attempt: int: number of the attempt that just failed, starting at 1
+        :return: bool
+        """
+        if attempt >= self.max_attempts:
+            return False
+        if idempotent:
+            return status_code in constants.RETRYABLE_STATUS_CODES
+        return status_code in constants.REJECTED_STATUS_CODES
+
+
+class RetryBudget:
+    """
+    Thread safe counter limiting the number of retries over a whole run
+    """
+    def __init__(self, budget: int = constants.RETRY_BUDGET):
+        self.remaining = budget
+        self._lock = threading.Lock()
+
+    def consume(self) -> bool:
+        """
+        Take one retry from the budget
+        :return: bool: False when the budget is exhausted
+        """
+        with self._lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+
+class LatencyTracker:
+    """
+    Sliding windows of request latencies, one per endpoint, used to compute the hedging thresholds
+    When a history file is given, the windows are loaded from it and saved after every observation,
+    so the thresholds carry over between runs.
+    """
+    def __init__(
+        self,
+        percentile: int = constants.HEDGE_PERCENTILE,
+        min_samples: int = constants.HEDGE_MIN_SAMPLES,
+        default_delay: float = constants.HEDGE_DEFAULT_DELAY,
+        window_size: int = constants.HEDGE_WINDOW_SIZE,
+        history_file: str = None,
+    ):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self.history_file = Path(history_file) if history_file else None
+        self._samples = defaultdict(lambda: deque(maxlen=window_size))
+        self._lock = threading.Lock()
+        if self.history_file and self.history_file.exists():
+            try:
+                history = json.loads(self.history_file.read_text())
+            except ValueError:
+                logger.warning(f"Ignoring unreadable latency history {self.history_file}")
+                history = {}
+            for key, samples in history.items():
+                self._samples[key].extend(samples)
+
+    def observe(self, key: str, latency: float):
+        """
+        Record the latency of a completed request
+        :param key: str: endpoint the request was sent to
+        :param latency: float: latency in seconds
+        :return: None
+        """
+        with self._lock:
+            self._samples[key].append(latency)
+            if self.history_file:
+                self.history_file.parent.mkdir(parents=True, exist_ok=True)
+                self.history_file.write_text(
+                    json.dumps({name: list(samples) for name, samples in self._samples.items()})
+                )
+
+    def hedge_delay(self, key: str) -> float:
+        """
+        Seconds to wait for a request before issuing a hedged duplicate
+        :param key: str: endpoint the request is sent to
+        :return: float: configured percentile of the endpoint latencies, or the default delay
+        """
+        with self._lock:
+            samples = list(self._samples.get(key, ()))
+        if len(samples) < self.min_samples:
+            return self.default_delay
+        return quantiles(samples, n=100)[self.percentile - 1]
@@ -1,10 +1,16 @@
 import csv
 import json
+import queue
+import threading
+import time
 import requests
 from schema import SchemaError
 from pathlib import Path
 from . import constants
 from . import logger, console
+from .cassette import CassettePlayer, CassetteRecorder
+from .exceptions import HCXConnectionError, HCXResponseError, RetryBudgetExhausted
+from .retry import LatencyTracker, RetryBudget, RetryPolicy
 from typing import Dict, List
 
 # disable insure login
@@ -223,13 +229,31 @@ def write_csv_file(filename: str, rows: list):
     """
     file_path = Path("migration_outputs") / f"{filename}.csv"
     file_path.parent.mkdir(exist_ok=True)
-    headers = ["migrationId", "migrationGroupId", "entityId"]
+    headers = constants.MIGRATION_ID_HEADERS
     with open(file_path, "w", newline="", encoding="utf-8-sig") as f:
         writer = csv.DictWriter(f, headers)
         writer.writeheader()
         writer.writerows(rows)
 
 
+def append_csv_file(filename: str, headers: list, rows: list):
+    """
+    Function to append rows to a CSV file, writing the header when the file is created
+    :param filename: str: name of the file
+    :param headers: list: column names
+    :param rows: list: list of dictionaries
+    :return: None
+    """
+    file_path = Path("migration_outputs") / f"{filename}.csv"
+    file_path.parent.mkdir(exist_ok=True)
+    is_new_file = not file_path.exists()
+    with open(file_path, "a", newline="", encoding="utf-8-sig" if is_new_file else "utf-8") as f:
+        writer = csv.DictWriter(f, headers, extrasaction="ignore")
+        if is_new_file:
+            writer.writeheader()
+        writer.writerows(rows)
+
+
 def generate_migration_payload(
     source_endpoint: Dict,
     destination_endpoint: Dict,
@@ -440,28 +464,141 @@ class MakeApiRequest:
     """
     Class to make API requests
     """
-    def __init__(self, base_url, headers):
+    def __init__(
+        self,
+        base_url,
+        headers,
+        retry_policy: RetryPolicy = None,
+        retry_budget: RetryBudget = None,
+        latency_tracker: LatencyTracker = None,
+        recorder: CassetteRecorder = None,
+        player: CassettePlayer = None,
+    ):
         self.url = base_url
         self.headers = headers
-
-    def __call__(self, method: str, endpoint: str, **kwargs):
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.retry_budget = retry_budget or RetryBudget()
+        self.latency_tracker = latency_tracker or LatencyTracker()
+        # when set, exchanges are written to a cassette / served from a cassette instead of HCX
+        self.recorder = recorder
+        self.player = player
+
+    def __call__(
+        self,
+        method: str,
+        endpoint: str,
+        idempotent: bool = False,
+        hedge: bool = False,
+        **kwargs,
+    ):
+        """
+        Send a request to HCX, retrying transient failures
+        :param method: str: HTTP method
+        :param endpoint: str: API endpoint relative to the base url
+        :param idempotent: bool: whether the request can safely be replayed
+        :param hedge: bool: issue a second request when the first one is slower than the hedging threshold
+        :return: response items, or the response body when it has no items
+        :raises HCXConnectionError: when HCX could not be reached
+        :raises HCXResponseError: when HCX answered with a non-2xx status code
+        :raises RetryBudgetExhausted: when the per-run retry budget is used up
+        """
         url = f"{self.url}/{endpoint}"
-        try:
-            response = requests.request(
-                method=method, url=url, headers=self.headers, verify=False, **kwargs
-            )
-            response_json = response.json()
-            status_code = response.status_code
-            if 200 <= status_code < 300:
-                if "data" in response_json and "items" in response_json["data"]:
-                    return response_json["data"]["items"]
-                elif "items" in response_json:
-                    return response_json["items"]
+        kwargs.setdefault("timeout", constants.REQUEST_TIMEOUT)
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                if hedge and idempotent:
+                    response = self._send_hedged(method, url, endpoint, **kwargs)
                 else:
-                    return response_json
+                    response = self._send(method, url, **kwargs)
+            except requests.exceptions.RequestException as e:
+                logger.error(f"{method} {url} attempt {attempt} failed: {e}")
+                if not self.retry_policy.should_retry_exception(e, idempotent, attempt):
+                    raise HCXConnectionError(method, url, attempt, e) from e
+                error = e
+            else:
+                status_code = response.status_code
+                response_json = self._parse_body(response)
+                if 200 <= status_code < 300:
+                    if not isinstance(response_json, dict):
+                        return response_json
+                    if "data" in response_json and "items" in response_json["data"]:
+                        return response_json["data"]["items"]
+                    elif "items" in response_json:
+                        return response_json["items"]
+                    else:
+                        return response_json
+                logger.error(f"{method} {url} attempt {attempt} returned HTTP {status_code}")
+                error = HCXResponseError(method, url, status_code, response_json)
+                if not self.retry_policy.should_retry_status(status_code, idempotent, attempt):
+                    raise error
+
+            if not self.retry_budget.consume():
+                raise RetryBudgetExhausted(method, url, error)
+            delay = self.retry_policy.backoff(attempt)
+            logger.warning(f"Retrying {method} {url} in {delay:.2f}s")
+            self.wait(delay)
+
+    def wait(self, seconds: float):
+        """
+        Sleep between requests, scaled by the replay speed when serving a cassette
+        :param seconds: float: duration against a live HCX
+        :return: None
+        """
+        if self.player:
+            self.player.wait(seconds)
+        else:
+            time.sleep(seconds)
+
+    def _send(self, method: str, url: str, latency_key: str = None, **kwargs):
+        started = time.monotonic()
+        try:
+            if self.player:
+                response = self.player.play(method, url, kwargs.get("data"))
             else:
-                return response_json
+                response = requests.request(
+                    method=method, url=url, headers=self.headers, verify=False, **kwargs
+                )
         except requests.exceptions.RequestException as e:
-            console.print_exception(extra_lines=8, show_locals=True)
-            logger.error(e)
-            return None
+            if self.recorder:
+                self.recorder.record(method, url, kwargs.get("data"), time.monotonic() - started, error=e)
+            raise
+        elapsed = time.monotonic() - started
+        if latency_key:
+            self.latency_tracker.observe(latency_key, elapsed)
+        if self.recorder:
+            self.recorder.record(method, url, kwargs.get("data"), elapsed, response=response)
+        return response
+
+    def _send_hedged(self, method: str, url: str, endpoint: str, **kwargs):
+        delay = self.latency_tracker.hedge_delay(endpoint)
+        results = queue.Queue()
+
+        def attempt():
+            try:
+                results.put((self._send(method, url, latency_key=endpoint, **kwargs), None))
+            except Exception as e:
+                results.put((None, e))
+
+        # daemon threads, so a stalled request left behind never holds the process open at exit
+        threading.Thread(target=attempt, daemon=True).start()
+        try:
+            response, error = results.get(timeout=delay)
+        except queue.Empty:
+            logger.info(f"{method} {url} slower than {delay:.2f}s, sending hedged request")
+            threading.Thread(target=attempt, daemon=True).start()
+            response, error = results.get()
+            if error is not None:
+                # the other request may still succeed
+                response, error = results.get()
+        if error is not None:
+            raise error
+        return response
+
+    @staticmethod
+    def _parse_body(response):
+        try:
+            return response.json()
+        except ValueError:
+            return response.text
@@ -0,0 +1,140 @@
+import csv
+
+import pytest
+
+from migration.analytics import (
+    MIGRATION_TIMESERIES_HEADERS,
+    WAVE_TIMESERIES_HEADERS,
+    ReplicationTracker,
+    extract_progress,
+)
+
+
+def status(progress, state="TRANSFER", vm="vm1", datastore="ds1", endpoint="dst"):
+    return {
+        "state": state,
+        "progress": progress,
+        "entity": {"entityName": vm},
+        "storage": {"defaultStorage": {"name": datastore}},
+        "destination": {"endpointName": endpoint},
+    }
+
+
+def record_series(tracker, migration_id, progresses, interval=10, **labels):
+    for index, progress in enumerate(progresses):
+        tracker.record(migration_id, status(progress, **labels), timestamp=index * interval)
+
+
+def bytes_progress(transferred, total=1e9):
+    return {"disks": [{"transferredBytes": transferred, "totalBytes": total}]}
+
+
+def test_extract_progress_derives_percent_from_bytes():
+    sample = extract_progress(status(bytes_progress(25, total=100)), timestamp=1)
+    assert (sample.percent, sample.transferred_bytes, sample.total_bytes) == (25, 25, 100)
+
+
+def test_extract_progress_only_searches_the_progress_block():
+    item = status({"log": []})
+    item["entity"]["summary"] = {"percentComplete": 99, "totalBytes": 5}
+    item["transferParams"] = {"transferredBytes": 7}
+    sample = extract_progress(item, timestamp=1)
+    assert (sample.percent, sample.transferred_bytes, sample.total_bytes) == (None, None, None)
+
+
+def test_estimate_in_bytes():
+    tracker = ReplicationTracker()
+    record_series(tracker, "m1", [bytes_progress(0), bytes_progress(1e8), bytes_progress(2e8)])
+    estimate = tracker.estimate("m1")
+    assert estimate["unit"] == "bytes"
+    assert estimate["rate"] == estimate["byteRate"] == pytest.approx(1e7)
+    assert estimate["percentRate"] == pytest.approx(1.0)
+    assert estimate["eta"] == estimate["etaLow"] == estimate["etaHigh"] == pytest.approx(80)
+
+
+def test_estimate_in_percent_with_a_single_interval():
+    tracker = ReplicationTracker()
+    record_series(tracker, "m1", [{"percentComplete": 10}, {"percentComplete": 20}])
+    estimate = tracker.estimate("m1")
+    assert estimate["unit"] == "percent"
+    assert estimate["percentRate"] == pytest.approx(1.0)
+    assert estimate["byteRate"] is None
+    assert estimate["eta"] == pytest.approx(80)
+    # a single interval gives no spread, the bounds stay open
+    assert estimate["etaLow"] == pytest.approx(40)
+    assert estimate["etaHigh"] is None
+
+
+def test_estimate_without_interval_has_no_rate():
+    tracker = ReplicationTracker()
+    record_series(tracker, "m1", [{"percentComplete": 10}])
+    assert tracker.estimate("m1")["rate"] is None
+
+
+def test_estimate_of_a_completed_migration():
+    tracker = ReplicationTracker()
+    tracker.record("m1", status({"percentComplete": 50}), timestamp=0)
+    tracker.record("m1", status({"percentComplete": 100}, state="MIGRATION_COMPLETE"), timestamp=10)
+    estimate = tracker.estimate("m1")
+    assert (estimate["rate"], estimate["eta"], estimate["etaLow"], estimate["etaHigh"]) == (0, 0, 0, 0)
+
+
+def test_estimate_ignores_progress_going_backwards():
+    tracker = ReplicationTracker()
+    record_series(tracker, "m1", [bytes_progress(0), bytes_progress(50), bytes_progress(10)])
+    assert tracker.estimate("m1")["rate"] == pytest.approx(2.5)
+
+
+def test_summary_groups_and_unweighted_percent_rate():
+    tracker = ReplicationTracker()
+    record_series(tracker, "m1", [bytes_progress(0), bytes_progress(1e8), bytes_progress(2e8)])
+    record_series(tracker, "m2", [{"percentComplete": p} for p in (0, 5, 10)], vm="vm2")
+    summary = tracker.summary()
+    assert summary["groups"]["vmName"]["vm2"] == {"byteRate": None, "percentRate": pytest.approx(0.5)}
+    assert summary["groups"]["datastore"]["ds1"]["byteRate"] == pytest.approx(1e7)
+    # vm2 does not report its size, so the percent rates are averaged without weights
+    assert summary["groups"]["datastore"]["ds1"]["percentRate"] == pytest.approx(0.75)
+    assert summary["aggregateRate"] == pytest.approx(1e7)
+    assert summary["activeMigrations"] == 2
+    # the wave finishes with its slowest migration, vm2 at 90% left and 0.5%/s
+    assert summary["eta"] == pytest.approx(180)
+
+
+def test_summary_weights_percent_rates_by_size():
+    tracker = ReplicationTracker()
+    record_series(tracker, "m1", [bytes_progress(0), bytes_progress(1e8), bytes_progress(2e8)])
+    record_series(
+        tracker, "m2", [{"percentComplete": p, "totalBytes": 3e9} for p in (0, 5, 10)], vm="vm2"
+    )
+    summary = tracker.summary()
+    assert summary["aggregatePercentRate"] == pytest.approx((1.0 * 1e9 + 0.5 * 3e9) / 4e9)
+    assert summary["aggregateRate"] == pytest.approx(1e7 + 0.005 * 3e9)
+
+
+def test_summary_of_a_completed_wave():
+    tracker = ReplicationTracker()
+    tracker.record("m1", status({"percentComplete": 100}, state="MIGRATION_COMPLETE"), timestamp=0)
+    summary = tracker.summary()
+    assert summary["activeMigrations"] == 0
+    assert summary["eta"] == 0
+
+
+def test_save_writes_time_series(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    tracker = ReplicationTracker()
+    record_series(tracker, "m1", [bytes_progress(0), bytes_progress(1e8)])
+    tracker.save(tracker.summary(), timestamp=0)
+    tracker.save(tracker.summary(), timestamp=10)
+
+    with open(tmp_path / "migration_outputs" / "replication_timeseries.csv", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        rows = list(reader)
+    assert reader.fieldnames == MIGRATION_TIMESERIES_HEADERS
+    assert [row["migrationId"] for row in rows] == ["m1", "m1"]
+    assert float(rows[0]["byteRate"]) == pytest.approx(1e7)
+
+    with open(tmp_path / "migration_outputs" / "replication_wave_timeseries.csv", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        rows = list(reader)
+    assert reader.fieldnames == WAVE_TIMESERIES_HEADERS
+    assert len(rows) == 2
@@ -0,0 +1,117 @@
+import gzip
+import json
+import time
+
+import pytest
+import requests
+import typer
+
+import main
+from migration.cassette import CassettePlayer, CassetteRecorder, redact
+from migration.exceptions import CassetteMiss
+from migration.retry import RetryBudget, RetryPolicy
+from migration.utils import MakeApiRequest
+
+STATUS_BODY = json.dumps({"filter": {"migrationId": ["m1"]}, "password": "hunter2"})
+
+
+def make_response(status_code, body):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(body).encode()
+    response.headers["x-hm-authorization"] = "secret-token"
+    return response
+
+
+def make_api(**kwargs):
+    return MakeApiRequest(
+        "https://hcx/hybridity/api",
+        {"x-hm-authorization": "secret-token"},
+        retry_policy=RetryPolicy(base_delay=0),
+        retry_budget=RetryBudget(10),
+        **kwargs,
+    )
+
+
+@pytest.fixture
+def cassette(tmp_path, monkeypatch):
+    path = tmp_path / "wave.jsonl.gz"
+    outcomes = [
+        requests.exceptions.ConnectionError("reset"),
+        make_response(200, {"items": [{"state": "TRANSFER"}]}),
+        make_response(200, {"items": [{"state": "MIGRATION_COMPLETE"}]}),
+    ]
+
+    def transport(method, url, **kwargs):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(requests, "request", transport)
+    api = make_api(recorder=CassetteRecorder(path))
+    api("POST", "migrations/?action=query", idempotent=True, data=STATUS_BODY)
+    api("POST", "migrations/?action=query", idempotent=True, data=STATUS_BODY)
+    return path
+
+
+def test_redact_nested_credentials():
+    data = {"Password": "p", "items": [{"token": "t", "name": "vm"}], "headers": {"X-HM-Authorization": "a"}}
+    assert redact(data) == {
+        "Password": "REDACTED",
+        "items": [{"token": "REDACTED", "name": "vm"}],
+        "headers": {"X-HM-Authorization": "REDACTED"},
+    }
+
+
+def test_recorded_cassette_has_no_credentials(cassette):
+    with gzip.open(cassette, "rt", encoding="utf-8") as f:
+        content = f.read()
+    assert "hunter2" not in content
+    assert "secret-token" not in content
+    assert len(content.splitlines()) == 3
+
+
+def test_replay_round_trip_settles_on_last_response(cassette, monkeypatch):
+    monkeypatch.setattr(requests, "request", pytest.fail)
+    api = make_api(player=CassettePlayer(cassette, speed=0))
+    # the recorded connection error is replayed and retried like the original one
+    first = api("POST", "migrations/?action=query", idempotent=True, data=STATUS_BODY)
+    second = api("POST", "migrations/?action=query", idempotent=True, data=STATUS_BODY)
+    third = api("POST", "migrations/?action=query", idempotent=True, data=STATUS_BODY)
+    assert [first, second, third] == [
+        [{"state": "TRANSFER"}],
+        [{"state": "MIGRATION_COMPLETE"}],
+        [{"state": "MIGRATION_COMPLETE"}],
+    ]
+
+
+def test_replay_ignores_host(cassette):
+    api = MakeApiRequest("https://other-hcx/hybridity/api", {}, player=CassettePlayer(cassette, speed=0))
+    api.retry_policy = RetryPolicy(base_delay=0)
+    assert api("POST", "migrations/?action=query", idempotent=True, data=STATUS_BODY)
+
+
+def test_replay_miss_is_not_retried(cassette):
+    api = make_api(player=CassettePlayer(cassette, speed=0))
+    with pytest.raises(CassetteMiss):
+        api("POST", "service/inventory/networks", idempotent=True, data="{}")
+    assert api.retry_budget.remaining == 10
+
+
+def test_player_wait_is_scaled_by_speed(cassette, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(time, "sleep", sleeps.append)
+    CassettePlayer(cassette, speed=10).wait(5)
+    CassettePlayer(cassette, speed=0).wait(5)
+    make_api(player=CassettePlayer(cassette, speed=4)).wait(8)
+    assert sleeps == [0.5, 2]
+
+
+def test_record_and_replay_cannot_share_a_cassette(cassette, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(typer.BadParameter):
+        main.get_cassettes(str(cassette), cassette.name, 1.0)
+    # the cassette was not truncated
+    with gzip.open(cassette, "rt", encoding="utf-8") as f:
+        assert len(f.readlines()) == 3
@@ -0,0 +1,74 @@
+import pytest
+import typer
+
+import main
+from migration import constants
+from migration.exceptions import CassetteMiss, HCXConnectionError, HCXResponseError, RetryBudgetExhausted
+from migration.profiling import Profiler
+
+
+class StubHCX:
+    """
+    Stand-in for HCX answering status queries from a script of items or errors per migration ID
+    """
+    def __init__(self, **script):
+        self.script = script
+        self.polls = 0
+
+    def get_migration_status(self, migration_id):
+        self.polls += 1
+        outcome = self.script[migration_id]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return [outcome]
+
+    def wait(self, seconds):
+        pass
+
+
+@pytest.fixture
+def poll(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    def run(hcx, *migration_ids):
+        monkeypatch.setattr(main, "get_hcx_instance", lambda *args, **kwargs: hcx)
+        main.poll_migration_status(migration_ids=list(migration_ids), profiler=Profiler("check_status"))
+
+    return run
+
+
+def complete(migration_id):
+    return {"state": "MIGRATION_COMPLETE", "progress": {"log": [{"message": f"{migration_id} done"}]}}
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        CassetteMiss("POST", "migrations/?action=query"),
+        RetryBudgetExhausted("POST", "migrations/?action=query", OSError("down")),
+        HCXResponseError("POST", "migrations/?action=query", 401, {"message": "unauthorized"}),
+    ],
+)
+def test_permanent_errors_stop_polling(poll, error):
+    hcx = StubHCX(m1=error)
+    with pytest.raises(typer.Exit):
+        poll(hcx, "m1")
+    assert hcx.polls == 1
+
+
+def test_transient_errors_give_up_after_max_failed_polls(poll):
+    hcx = StubHCX(m1=HCXConnectionError("POST", "migrations/?action=query", 5, OSError("down")))
+    with pytest.raises(typer.Exit):
+        poll(hcx, "m1")
+    assert hcx.polls == constants.STATUS_MAX_FAILED_POLLS
+
+
+def test_polling_stops_when_migrations_complete(poll):
+    hcx = StubHCX(m1=complete("m1"))
+    poll(hcx, "m1")
+    assert hcx.polls == 1
+
+
+def test_rate_limited_poll_is_not_permanent():
+    assert not main.is_permanent_error(HCXResponseError("POST", "migrations", 429, {}))
+    assert not main.is_permanent_error(HCXResponseError("POST", "migrations", 503, {}))
@@ -0,0 +1,127 @@
+import csv
+import threading
+
+import pytest
+
+from migration.exceptions import HCXConnectionError, StartPipelineError
+from migration.pipeline import StartPipeline
+
+
+class StubHCX:
+    """
+    Stand-in for HCX recording start requests, answering with one migrationId per item
+    """
+    def __init__(self, fail_on=(), response=None, block=None):
+        self.batches = []
+        self.fail_on = fail_on
+        self.response = response
+        self.block = block
+        self.entered = threading.Event()
+
+    def migrate(self, migration_objects, action):
+        assert action == "start"
+        self.batches.append([item["vm"] for item in migration_objects])
+        self.entered.set()
+        if self.block:
+            self.block.wait(5)
+        if len(self.batches) in self.fail_on:
+            raise HCXConnectionError("POST", "start", 1, OSError("down"))
+        if self.response is not None:
+            return self.response
+        return [
+            {"migrationId": f"id-{item['vm']}", "migrationGroupId": "g", "entityId": item["vm"]}
+            for item in migration_objects
+        ]
+
+
+@pytest.fixture(autouse=True)
+def outputs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path / "migration_outputs"
+
+
+def submit_all(pipeline, *vm_names):
+    for vm_name in vm_names:
+        pipeline.submit(vm_name, {"vm": vm_name})
+
+
+def read_ids(outputs):
+    with open(outputs / "migration_ids.csv", encoding="utf-8-sig") as f:
+        return [row["migrationId"] for row in csv.DictReader(f)]
+
+
+def test_items_are_started_in_batches_and_persisted(outputs):
+    hcx = StubHCX()
+    with StartPipeline(hcx, batch_size=2, flush_interval=5) as pipeline:
+        submit_all(pipeline, "vm1", "vm2", "vm3")
+    assert hcx.batches == [["vm1", "vm2"], ["vm3"]]
+    assert read_ids(outputs) == ["id-vm1", "id-vm2", "id-vm3"]
+    assert len(pipeline.started) == 3
+    assert pipeline.failed == []
+
+
+def test_partial_batch_is_started_after_flush_interval():
+    hcx = StubHCX()
+    with StartPipeline(hcx, batch_size=10, flush_interval=0.05) as pipeline:
+        submit_all(pipeline, "vm1")
+        assert hcx.entered.wait(5)
+    assert hcx.batches == [["vm1"]]
+
+
+def test_failed_batch_does_not_stop_the_pipeline(outputs):
+    hcx = StubHCX(fail_on=(1,))
+    with StartPipeline(hcx, batch_size=1, flush_interval=5) as pipeline:
+        submit_all(pipeline, "vm1", "vm2")
+    assert [item["vmName"] for item in pipeline.failed] == ["vm1"]
+    assert read_ids(outputs) == ["id-vm2"]
+
+
+def test_unexpected_error_stops_the_pipeline_and_fails_queued_items():
+    # a dict instead of a list of migrations cannot be written to migration_ids.csv
+    block = threading.Event()
+    hcx = StubHCX(response={"unexpected": True}, block=block)
+    pipeline = StartPipeline(hcx, batch_size=1, flush_interval=5, queue_size=5)
+    with pipeline:
+        submit_all(pipeline, "vm1")
+        assert hcx.entered.wait(5)
+        submit_all(pipeline, "vm2", "vm3")
+        block.set()
+        pipeline._thread.join(5)
+        with pytest.raises(StartPipelineError):
+            pipeline.submit("vm4", {"vm": "vm4"})
+    assert hcx.batches == [["vm1"]]
+    assert pipeline.error is not None
+    assert sorted(item["vmName"] for item in pipeline.failed) == ["vm1", "vm2", "vm3"]
+
+
+def test_queued_items_are_discarded_on_interrupt():
+    block = threading.Event()
+    hcx = StubHCX(block=block)
+    pipeline = StartPipeline(hcx, batch_size=1, flush_interval=5)
+    with pytest.raises(KeyboardInterrupt):
+        with pipeline:
+            submit_all(pipeline, "vm1")
+            assert hcx.entered.wait(5)
+            submit_all(pipeline, "vm2", "vm3")
+            # let the batch in flight finish while the pipeline aborts
+            threading.Timer(0.1, block.set).start()
+            raise KeyboardInterrupt
+    assert hcx.batches == [["vm1"]]
+    assert [item["migrationId"] for item in pipeline.started] == ["id-vm1"]
+    assert sorted(item["vmName"] for item in pipeline.failed) == ["vm2", "vm3"]
+
+
+def test_queued_items_are_started_when_the_run_crashes(outputs):
+    block = threading.Event()
+    hcx = StubHCX(block=block)
+    pipeline = StartPipeline(hcx, batch_size=1, flush_interval=5)
+    with pytest.raises(IndexError):
+        with pipeline:
+            submit_all(pipeline, "vm1")
+            assert hcx.entered.wait(5)
+            submit_all(pipeline, "vm2", "vm3")
+            block.set()
+            raise IndexError("list index out of range")
+    assert hcx.batches == [["vm1"], ["vm2"], ["vm3"]]
+    assert read_ids(outputs) == ["id-vm1", "id-vm2", "id-vm3"]
+    assert pipeline.failed == []
@@ -0,0 +1,79 @@
+import tracemalloc
+
+import pytest
+
+from migration.profiling import Profiler
+
+
+@pytest.fixture
+def outputs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path / "migration_outputs"
+
+
+def test_disabled_profiler_is_a_no_op(outputs):
+    with Profiler("test") as profiler:
+        with profiler.phase("work"):
+            pass
+    assert profiler.phases == {}
+    assert not tracemalloc.is_tracing()
+    assert not outputs.exists()
+
+
+def test_phase_calls_and_elapsed_accumulate(outputs):
+    with Profiler("test", enabled=True) as profiler:
+        for _ in range(3):
+            with profiler.phase("work"):
+                pass
+        first_elapsed = profiler.phases["work"].elapsed
+        with profiler.phase("work"):
+            pass
+    stats = profiler.phases["work"]
+    assert stats.calls == 4
+    assert stats.elapsed > first_elapsed > 0
+
+
+def test_run_wide_peak_is_kept_across_phases(outputs):
+    with Profiler("test", enabled=True) as profiler:
+        with profiler.phase("allocate"):
+            data = bytearray(4 * 1024 * 1024)
+            del data
+        # entering the next phase resets the tracemalloc peak
+        with profiler.phase("idle"):
+            pass
+    assert profiler.phases["allocate"].peak >= 4 * 1024 * 1024
+    assert profiler.phases["idle"].peak < 4 * 1024 * 1024
+    assert profiler.peak >= 4 * 1024 * 1024
+
+
+def test_repeated_phase_is_snapshotted_every_interval(outputs):
+    with Profiler("test", enabled=True, snapshot_interval=2) as profiler:
+        for _ in range(5):
+            with profiler.phase("work"):
+                pass
+    stats = profiler.phases["work"]
+    assert stats.first_snapshot is not None
+    assert stats.last_snapshot_call == 4
+    assert "grown between call 1 and call 4" in profiler.allocation_report()
+
+
+def test_phase_entered_once_has_no_growth_report(outputs):
+    with Profiler("test", enabled=True) as profiler:
+        with profiler.phase("work"):
+            pass
+    assert profiler.phases["work"].last_snapshot is None
+    assert "grown between" not in profiler.allocation_report()
+
+
+def test_reports_are_written_to_migration_outputs(outputs):
+    with Profiler("test", enabled=True) as profiler:
+        with profiler.phase("work"):
+            pass
+    assert not tracemalloc.is_tracing()
+    profiles = list(outputs.glob("test_*.prof"))
+    reports = list(outputs.glob("test_*_allocations.txt"))
+    assert len(profiles) == 1 and profiles[0].stat().st_size > 0
+    assert len(reports) == 1
+    report = reports[0].read_text(encoding="utf-8")
+    assert "== Phase work: 1 call(s)" in report
+    assert "== End of test" in report
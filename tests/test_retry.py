@@ -0,0 +1,179 @@
+import json
+import threading
+
+import pytest
+import requests
+
+from migration.exceptions import HCXConnectionError, HCXResponseError, RetryBudgetExhausted
+from migration.retry import LatencyTracker, RetryBudget, RetryPolicy
+from migration.utils import MakeApiRequest
+
+
+def make_response(status_code, body):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+    return response
+
+
+class FakeTransport:
+    """
+    Stand-in for requests.request serving scripted responses or exceptions in order
+    """
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, method, url, **kwargs):
+        with self._lock:
+            self.calls += 1
+            outcome = self.outcomes.pop(0)
+        if callable(outcome):
+            outcome = outcome()
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture
+def api():
+    return MakeApiRequest(
+        "https://hcx/hybridity/api",
+        {},
+        retry_policy=RetryPolicy(max_attempts=3, base_delay=0),
+        retry_budget=RetryBudget(10),
+    )
+
+
+@pytest.mark.parametrize(
+    "error, idempotent, expected",
+    [
+        (requests.exceptions.ConnectionError(), True, True),
+        (requests.exceptions.ReadTimeout(), True, True),
+        (requests.exceptions.ConnectTimeout(), False, True),
+        (requests.exceptions.ConnectionError(), False, False),
+        (requests.exceptions.ReadTimeout(), False, False),
+        (requests.exceptions.InvalidURL(), True, False),
+    ],
+)
+def test_should_retry_exception(error, idempotent, expected):
+    assert RetryPolicy().should_retry_exception(error, idempotent, attempt=1) is expected
+
+
+@pytest.mark.parametrize(
+    "status_code, idempotent, expected",
+    [(503, True, True), (429, True, True), (400, True, False), (503, False, False), (429, False, True)],
+)
+def test_should_retry_status(status_code, idempotent, expected):
+    assert RetryPolicy().should_retry_status(status_code, idempotent, attempt=1) is expected
+
+
+def test_no_retry_after_max_attempts():
+    policy = RetryPolicy(max_attempts=3)
+    assert not policy.should_retry_status(503, True, attempt=3)
+    assert not policy.should_retry_exception(requests.exceptions.ConnectionError(), True, attempt=3)
+
+
+def test_backoff_is_bounded():
+    policy = RetryPolicy(base_delay=1, max_delay=5)
+    for attempt in range(1, 10):
+        assert 0 <= policy.backoff(attempt) <= min(5, 2 ** (attempt - 1))
+
+
+def test_retry_budget():
+    budget = RetryBudget(2)
+    assert budget.consume() and budget.consume()
+    assert not budget.consume()
+    assert budget.remaining == 0
+
+
+def test_latency_tracker_uses_default_until_enough_samples():
+    tracker = LatencyTracker(min_samples=3, default_delay=7)
+    tracker.observe("inventory", 1)
+    tracker.observe("inventory", 1)
+    assert tracker.hedge_delay("inventory") == 7
+    tracker.observe("inventory", 1)
+    assert tracker.hedge_delay("inventory") == pytest.approx(1)
+    # other endpoints keep their own window
+    assert tracker.hedge_delay("status") == 7
+
+
+def test_latency_tracker_history_round_trip(tmp_path):
+    history_file = tmp_path / "latency.json"
+    tracker = LatencyTracker(min_samples=2, history_file=history_file)
+    tracker.observe("inventory", 2)
+    tracker.observe("inventory", 2)
+    assert LatencyTracker(min_samples=2, history_file=history_file).hedge_delay("inventory") == pytest.approx(2)
+
+
+def test_retries_transient_status_then_unwraps_items(api, monkeypatch):
+    transport = FakeTransport(make_response(503, {}), make_response(200, {"data": {"items": [1, 2]}}))
+    monkeypatch.setattr(requests, "request", transport)
+    assert api("POST", "inventory", idempotent=True) == [1, 2]
+    assert transport.calls == 2
+    assert api.retry_budget.remaining == 9
+
+
+def test_non_idempotent_request_is_not_replayed(api, monkeypatch):
+    transport = FakeTransport(make_response(503, "<html>unavailable</html>"))
+    monkeypatch.setattr(requests, "request", transport)
+    with pytest.raises(HCXResponseError) as error:
+        api("POST", "mobility/migrations/start")
+    assert error.value.status_code == 503
+    assert error.value.body == "<html>unavailable</html>"
+    assert transport.calls == 1
+
+
+def test_non_idempotent_request_is_replayed_when_never_sent(api, monkeypatch):
+    transport = FakeTransport(requests.exceptions.ConnectTimeout(), make_response(200, {"items": ["ok"]}))
+    monkeypatch.setattr(requests, "request", transport)
+    assert api("POST", "mobility/migrations/start") == ["ok"]
+
+
+def test_connection_error_after_max_attempts(api, monkeypatch):
+    transport = FakeTransport(*[requests.exceptions.ConnectionError("down")] * 3)
+    monkeypatch.setattr(requests, "request", transport)
+    with pytest.raises(HCXConnectionError) as error:
+        api("POST", "inventory", idempotent=True)
+    assert error.value.attempts == 3
+
+
+def test_retry_budget_exhausted(api, monkeypatch):
+    api.retry_budget = RetryBudget(0)
+    monkeypatch.setattr(requests, "request", FakeTransport(make_response(503, {})))
+    with pytest.raises(RetryBudgetExhausted):
+        api("POST", "inventory", idempotent=True)
+
+
+def test_hedged_request_returns_the_faster_response(api, monkeypatch):
+    release = threading.Event()
+
+    def stalled():
+        release.wait(5)
+        return make_response(200, {"items": ["slow"]})
+
+    transport = FakeTransport(stalled, make_response(200, {"items": ["fast"]}))
+    monkeypatch.setattr(requests, "request", transport)
+    api.latency_tracker = LatencyTracker(default_delay=0.05)
+    try:
+        assert api("POST", "inventory", idempotent=True, hedge=True) == ["fast"]
+        assert transport.calls == 2
+    finally:
+        release.set()
+
+
+def test_hedged_request_waits_for_the_other_attempt_on_error(api, monkeypatch):
+    release = threading.Event()
+
+    def stalled():
+        release.wait(5)
+        return make_response(200, {"items": ["slow"]})
+
+    def failing():
+        release.set()
+        raise requests.exceptions.ConnectionError("reset")
+
+    monkeypatch.setattr(requests, "request", FakeTransport(stalled, failing))
+    api.latency_tracker = LatencyTracker(default_delay=0.05)
+    assert api("POST", "inventory", idempotent=True, hedge=True) == ["slow"]